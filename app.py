@@ -5,68 +5,334 @@ import shutil
 import tempfile
 import re
 import time
-import glob # Import glob for file searching
 import shutil # Add this import at the top with other imports
+import requests
+import functools
+import atexit
+import collections
+import contextlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import MappingProxyType
 
 # --- Configuration ---
-TEMP_DIR = "temp_downloads"
 MAX_FILE_SIZE_MB = 500
+SHM_DIR = "/dev/shm"
+
+# Pick a RAM-backed temp directory when possible so downloads and the re-read for
+# st.download_button don't hit persistent disk. YT_TMP overrides the choice. Only called once per
+# server process, by ensure_temp_dir.
+def pick_temp_dir():
+    if "YT_TMP" in os.environ:
+        return os.environ["YT_TMP"]
+    if os.path.isdir(SHM_DIR):
+        try:
+            # Only use /dev/shm if it has room for a couple of maximum-size downloads
+            if shutil.disk_usage(SHM_DIR).free > 2 * MAX_FILE_SIZE_MB * 1024 * 1024:
+                return os.path.join(SHM_DIR, "yt_downloads")
+        except OSError:
+            pass
+    return os.path.join(tempfile.gettempdir(), "yt_downloads")
+
 # Ensure ffmpeg_location is correctly set for your system
 # IMPORTANT: Adjust this path if your ffmpeg.exe is located elsewhere!
 # On Windows, it should point directly to ffmpeg.exe
 # On Linux/macOS, it's usually just 'ffmpeg' if it's in your PATH, or a full path like '/usr/bin/ffmpeg'
 FFMPEG_LOCATION = '/usr/bin/ffmpeg' if os.name != 'nt' else r'C:\Users\admin\Documents\ffmpeg\bin\ffmpeg.exe' # Adjusted for Windows based on your logs
+# aria2c lets yt-dlp fetch each file over several parallel connections (yt-dlp picks the aria2c flags
+# itself). Opt-in from the sidebar when it is installed: yt-dlp gets no progress from external
+# downloaders, so no live progress is shown until each stream is complete.
+ARIA2C_AVAILABLE = shutil.which('aria2c') is not None
+# Number of DASH/HLS fragments yt-dlp downloads at once per video (adjustable in the sidebar)
+DEFAULT_CONCURRENT_FRAGMENTS = 8
+MAX_CONCURRENT_FRAGMENTS = 16
+# Number of playlist videos downloaded at the same time (adjustable in the sidebar)
+DEFAULT_PLAYLIST_WORKERS = 4
+MAX_PLAYLIST_WORKERS = 8
+# How often the download panel redraws a running download's progress; each redraw is a fragment
+# rerun and a websocket message to the browser, independent of how often yt-dlp calls its hooks
+PROGRESS_UPDATE_INTERVAL_SECONDS = 0.5
+# How often the Downloaded Files list re-checks its files on disk; other reruns reuse the sizes
+# recorded when each download finished instead of calling stat() on every file each time
+DOWNLOADED_FILES_REFRESH_SECONDS = 30
+# Downloads run as background jobs so the page stays usable; at most this many run at once across sessions
+MAX_CONCURRENT_DOWNLOAD_JOBS = 4
+# Content types sent with downloaded files, so the browser knows it is getting a video or audio file
+DOWNLOAD_MIME_TYPES = {'.mp4': 'video/mp4', '.webm': 'video/webm', '.mp3': 'audio/mpeg', '.m4a': 'audio/mp4', '.opus': 'audio/ogg'}
+# Files in TEMP_DIR untouched for this long are removed by the background janitor, checked every interval.
+# Files of a job only start aging once the job has been collected (see record_downloaded_file)
+TEMP_FILE_TTL_SECONDS = 600
+JANITOR_INTERVAL_SECONDS = 60
+# Size above which the janitor also removes the oldest temp files, even if they aren't stale yet
+TEMP_DIR_MAX_BYTES = MAX_FILE_SIZE_MB * 4 * 1024 * 1024
+# Extra ffmpeg arguments for the merge and MP3 conversion steps unless verbose logging is on: yt-dlp
+# runs ffmpeg with '-loglevel repeat+info' and reads all of its stderr, errors are all it needs
+QUIET_FFMPEG_ARGS = {
+    'merger+ffmpeg_i1': ['-loglevel', 'error'],
+    'extractaudio+ffmpeg_i1': ['-loglevel', 'error'],
+}
+# Threads used to remove files when the temporary downloads are cleaned
+CLEANUP_WORKERS = 8
+# Request headers sent with every download; read-only so a download can't change them for the next one
+DOWNLOAD_HTTP_HEADERS = MappingProxyType({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/95.0.4638.74 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-us,en;q=0.5',
+    'Sec-Fetch-Mode': 'navigate'
+})
+# yt-dlp options that are the same for every download, built once; each download copies them and
+# adds its own output template, hooks, format and sidebar settings
+BASE_DOWNLOAD_YDL_OPTS = MappingProxyType({
+    'ffmpeg_location': FFMPEG_LOCATION,
+    'retries': 3,
+    'continuedl': True, # Resume a leftover .part file with a Range request instead of restarting
+    'compat_opts': frozenset(), # yt-dlp copies this into its own set
+    'noplaylist': True, # Ensure only a single video is downloaded by each YoutubeDL call
+    'http_headers': DOWNLOAD_HTTP_HEADERS,
+})
+# Video IDs can be read straight from a YouTube URL, which lets us guess the thumbnail URL before yt-dlp
+# returns and give every URL form of the same video one canonical URL
+YOUTUBE_VIDEO_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([A-Za-z0-9_-]{11})')
+YOUTUBE_WATCH_URL_TEMPLATE = "https://www.youtube.com/watch?v={video_id}"
+YOUTUBE_PLAYLIST_RE = re.compile(r'(?:youtube\.com|youtu\.be)/.*[?&]list=[A-Za-z0-9_-]+')
+THUMBNAIL_URL_TEMPLATE = "https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+THUMBNAIL_TIMEOUT_SECONDS = 5
+# Selected playlist videos tried, in order, until one yields the formats the download options are built from
+FORMAT_PROBE_ATTEMPTS = 5
 
 
 # --- Helper Functions ---
 def create_temp_dir():
-    if not os.path.exists(TEMP_DIR):
-        os.makedirs(TEMP_DIR)
+    os.makedirs(TEMP_DIR, exist_ok=True)
 
-def clean_temp_dir():
-    if os.path.exists(TEMP_DIR):
-        try:
-            shutil.rmtree(TEMP_DIR)
-            st.toast("Cleaned up temporary files! ✅", icon="🧹")
-            os.makedirs(TEMP_DIR)
-        except OSError as e:
-            st.warning(f"Error cleaning up temp directory: {e}")
-    else:
-        os.makedirs(TEMP_DIR)
+# Remove one file, returning the error instead of raising so unlink_files can report it afterwards
+def unlink_file(file_path):
+    try:
+        os.unlink(file_path)
+    except FileNotFoundError:
+        pass # Already gone (e.g. a stream file removed by yt-dlp after merging)
+    except OSError as e:
+        return e
+    return None
+
+# Remove many files at once on a small thread pool, so large deletions (many big videos) overlap
+# instead of waiting on each unlink in turn; the errors are shown from the script thread
+def unlink_files(file_paths):
+    with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+        for file_path, error in zip(file_paths, executor.map(unlink_file, file_paths)):
+            if error is not None:
+                st.warning(f"Error removing temporary file {os.path.basename(file_path)}: {error}")
+
+# Remove temporary downloads. When the files this session produced are known, only those are
+# unlinked (no directory scan, and other sessions' files are left alone); otherwise empty TEMP_DIR,
+# except for the files of download jobs still running and the files other sessions list for download.
+def clean_temp_dir(produced_files=None):
+    if produced_files:
+        unlink_files(produced_files)
+        produced_files.clear()
+        st.toast("Cleaned up temporary files! ✅", icon="🧹")
+        return
+    try:
+        # Empty the directory in a single scandir pass instead of removing and recreating it
+        file_paths = []
+        with os.scandir(TEMP_DIR) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                elif not is_active_download_file(entry.path) and not is_listed_download_file(entry.path):
+                    file_paths.append(entry.path)
+        unlink_files(file_paths)
+        st.toast("Cleaned up temporary files! ✅", icon="🧹")
+    except FileNotFoundError:
+        create_temp_dir() # Nothing to clean, just make sure the directory exists again
+    except OSError as e:
+        st.warning(f"Error cleaning up temp directory: {e}")
+
+# Temp files the janitor leaves alone, shared by every session of the server process:
+# - output file prefixes (TEMP_DIR path up to the first template field) of the download jobs that
+#   haven't been collected yet. All files of a download (streams waiting to be merged, .part files,
+#   the merge output) start with its prefix, and they stay held until finish_download_job has listed them.
+# - paths shown in some session's Downloaded Files list. The size pass doesn't remove those; the TTL
+#   pass still does, so the files of a session that was closed don't stay around forever.
+# Both count how many jobs or sessions hold each entry.
+@st.cache_resource(show_spinner=False)
+def get_held_temp_files():
+    return collections.Counter(), collections.Counter(), threading.Lock()
+
+HELD_DOWNLOAD_PREFIXES, LISTED_DOWNLOAD_FILES, HELD_TEMP_FILES_LOCK = get_held_temp_files()
+
+def download_prefix(output_template):
+    return output_template.split('%(', 1)[0]
+
+# Add one hold on each key of a held-files Counter
+def hold_temp_files(held, keys):
+    with HELD_TEMP_FILES_LOCK:
+        held.update(keys)
+
+# Remove one hold on each key; a key is dropped once nothing holds it any more
+def release_temp_files(held, keys):
+    with HELD_TEMP_FILES_LOCK:
+        held.subtract(keys)
+        for key in keys:
+            if held[key] <= 0:
+                held.pop(key, None)
+
+# Whether a temp file belongs to a download job that hasn't been collected yet
+def is_active_download_file(file_path):
+    with HELD_TEMP_FILES_LOCK:
+        return file_path.startswith(tuple(HELD_DOWNLOAD_PREFIXES))
+
+# Whether a temp file is on some session's Downloaded Files list
+def is_listed_download_file(file_path):
+    with HELD_TEMP_FILES_LOCK:
+        return file_path in LISTED_DOWNLOAD_FILES
+
+# Remove temp files older than TEMP_FILE_TTL_SECONDS, then the oldest ones while TEMP_DIR is over
+# TEMP_DIR_MAX_BYTES. Files of download jobs that haven't been collected are never removed. The size
+# pass only removes finished files that no session lists, never .part/.ytdl ones, and stops when only
+# held files are left. Runs on the janitor thread, so no UI calls here.
+def remove_stale_temp_files():
+    cutoff = time.time() - TEMP_FILE_TTL_SECONDS
+    remaining = [] # (mtime, size, path) of the files kept, for the size check below
+    total_size = 0 # Includes the files the size pass may not remove, they still take up the space
+    try:
+        with os.scandir(TEMP_DIR) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    file_stat = entry.stat()
+                    in_use = is_active_download_file(entry.path)
+                    if file_stat.st_mtime < cutoff and not in_use:
+                        os.unlink(entry.path)
+                        continue
+                    total_size += file_stat.st_size
+                    if not in_use and not entry.name.endswith(('.part', '.ytdl')) and not is_listed_download_file(entry.path):
+                        remaining.append((file_stat.st_mtime, file_stat.st_size, entry.path))
+                except OSError:
+                    pass # Already removed or still in use, it will be retried on the next pass
+    except FileNotFoundError:
+        return
+
+    # If recent downloads alone take more than TEMP_DIR_MAX_BYTES, remove the least recently
+    # modified finished files until they fit again. A download may have started, or a file been
+    # listed, since the scan, so check each file again right before removing it.
+    for _, size, path in sorted(remaining):
+        if total_size <= TEMP_DIR_MAX_BYTES:
+            break
+        if is_active_download_file(path) or is_listed_download_file(path):
+            continue
+        if unlink_file(path) is None:
+            total_size -= size
+
+# Remove every file in TEMP_DIR when the server process exits; no UI calls, there is no session left
+def remove_all_temp_files():
+    try:
+        with os.scandir(TEMP_DIR) as entries:
+            file_paths = [entry.path for entry in entries if entry.is_file(follow_symlinks=False)]
+    except FileNotFoundError:
+        return
+    for file_path in file_paths:
+        unlink_file(file_path)
+
+def run_temp_janitor():
+    remove_stale_temp_files()
+    timer = threading.Timer(JANITOR_INTERVAL_SECONDS, run_temp_janitor)
+    timer.daemon = True # Don't keep the server process alive on shutdown
+    timer.start()
+
+# Start the janitor, and register the cleanup on exit, once per server process, not once per rerun or session
+@st.cache_resource(show_spinner=False)
+def start_temp_janitor():
+    run_temp_janitor()
+    atexit.register(remove_all_temp_files)
+    return True
+
+# Choose and create the temp directory once per server process; Streamlit re-executes this script on
+# every interaction. Every rerun uses the directory chosen first: the janitor and the exit cleanup
+# stay bound to it, so a rerun must not switch to another one when /dev/shm fills up.
+@st.cache_resource(show_spinner=False)
+def ensure_temp_dir():
+    temp_dir = pick_temp_dir()
+    os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir
 
 # Ensure temp directory exists at app startup
-create_temp_dir()
+TEMP_DIR = ensure_temp_dir()
+start_temp_janitor()
+
+# Slots for running postprocessors (ffmpeg), shared by every download of the server process: with
+# several downloads finishing at once (playlist workers, other sessions), at most one ffmpeg per CPU
+# runs and the others wait for a slot instead of all competing for the CPUs
+@st.cache_resource(show_spinner=False)
+def get_ffmpeg_slots():
+    return threading.BoundedSemaphore(os.cpu_count() or 1)
+
+FFMPEG_SLOTS = get_ffmpeg_slots()
 
 # Sanitize filenames for various OS compatibility
+# Characters illegal in Windows filenames are dropped with a precomputed translation table,
+# a single C-level pass instead of running the regex engine over every title
+ILLEGAL_FILENAME_CHARS = str.maketrans('', '', '<>:"/\\|?*')
+
 def sanitize_filename(filename):
-    # Remove characters illegal in Windows filenames, and trim leading/trailing spaces/dots
-    cleaned_filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-    # Replace sequences of dots at the end (common issue with some filenames)
-    cleaned_filename = re.sub(r'\.+$', '', cleaned_filename)
-    return cleaned_filename.strip() # Remove leading/trailing whitespace
-
-# Cache content info (video or playlist) to avoid re-fetching on every rerun
-@st.cache_data(show_spinner="Fetching content information...")
+    cleaned_filename = filename.translate(ILLEGAL_FILENAME_CHARS)
+    # Remove leading/trailing whitespace, then trailing dots and spaces (Windows strips those silently)
+    cleaned_filename = cleaned_filename.strip().rstrip('. ')
+    # Never return an empty name (it would produce a hidden ".ext" file)
+    return cleaned_filename or 'video'
+
+# Options for the YoutubeDL instances that only extract content info
+INFO_YDL_OPTS = {
+    'noplaylist': False, # Allow playlists
+    'quiet': True,
+    'skip_download': True,
+    'socket_timeout': 10, # Give up on a stalled info request after 10 s instead of waiting on it
+    'extract_flat': 'in_playlist', # List playlist entries without extracting each video; see get_video_formats
+    'ignore_errors': True # This ensures playlist processing continues even with unavailable videos
+}
+
+# Idle info-extraction YoutubeDL instances, kept across reruns and sessions so each fetch doesn't pay
+# for setting up a new instance. A pool rather than one shared instance, so concurrent sessions never
+# use the same instance at the same time.
+@st.cache_resource(show_spinner=False)
+def get_info_ydl_pool():
+    return queue.SimpleQueue()
+
+@contextlib.contextmanager
+def pooled_info_ydl():
+    pool = get_info_ydl_pool()
+    try:
+        ydl = pool.get_nowait()
+    except queue.Empty:
+        ydl = yt_dlp.YoutubeDL(INFO_YDL_OPTS)
+    try:
+        yield ydl
+    finally:
+        pool.put(ydl)
+
+# Flag each format's streams once at fetch time, so option generation on every rerun
+# reads a boolean instead of comparing codec strings
+def annotate_formats(video_info):
+    for f in video_info.get('formats') or []:
+        f['has_video'] = f.get('vcodec') != 'none'
+        f['has_audio'] = f.get('acodec') != 'none'
+
+# Cache content info (video or playlist) to avoid re-fetching on every rerun.
+# This function must stay free of Streamlit UI calls so its result can be cached
+# purely by URL; any error message is returned to the caller to display.
+@st.cache_data(ttl=3600, max_entries=128, show_spinner="Fetching content information...")
 def get_content_info(url):
     info = None # Initialize info to None
     try:
-        ydl_opts = {
-            'noplaylist': False, # Allow playlists
-            'quiet': True,
-            'skip_download': True,
-            'format': 'all',
-            'force_generic_extractor': True,
-            'retries': 3,
-            'extract_flat': False, # Crucial for getting full info for entries in a playlist
-            'ignore_errors': True # This ensures playlist processing continues even with unavailable videos
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with pooled_info_ydl() as ydl:
             info = ydl.extract_info(url, download=False)
             
             if not info:
                 # If info is None even with ignore_errors, it means URL might be invalid or completely inaccessible
-                st.error("Could not retrieve any information for the provided URL. It might be invalid or completely unavailable.")
-                return {'title': 'Content Not Found', 'webpage_url': url, '_type': 'video'}, False, []
+                error_message = "Could not retrieve any information for the provided URL. It might be invalid or completely unavailable."
+                return {'title': 'Content Not Found', 'webpage_url': url, '_type': 'video'}, False, [], error_message
 
             is_playlist = info.get('_type') == 'playlist'
             
@@ -76,12 +342,16 @@ def get_content_info(url):
                 # yt-dlp might return None for some entries if they're unavailable/deleted
                 # or an entry dictionary with 'availability': 'unavailable'
                 valid_entries = [e for e in entries if e is not None and e.get('availability') not in ['private', 'unlisted', 'unavailable']]
-                return info, is_playlist, valid_entries # main playlist info, True, list of video infos
+                for entry in valid_entries:
+                    # Flat entries only carry the video's URL in 'url'
+                    entry.setdefault('webpage_url', entry.get('url'))
+                return info, is_playlist, valid_entries, None # main playlist info, True, list of video infos, no error
             else:
-                return info, is_playlist, [info] # main video info, False, list containing single video info
+                annotate_formats(info)
+                return info, is_playlist, [info], None # main video info, False, list containing single video info, no error
 
     except yt_dlp.utils.DownloadError as e:
-        st.error(f"Error fetching content info for {url}: {e}")
+        error_message = f"Error fetching content info for {url}: {e}"
         # Create a minimal info dict to allow the app to continue without crashing
         # and display a message that content is unavailable.
         error_info = info if info else {
@@ -93,9 +363,9 @@ def get_content_info(url):
         if 'playlist' in url.lower() and not error_info.get('_type') == 'video':
              error_info['_type'] = 'playlist'
 
-        return error_info, error_info.get('_type') == 'playlist', [] # Return empty entries list on error
+        return error_info, error_info.get('_type') == 'playlist', [], error_message # Return empty entries list on error
     except Exception as e:
-        st.error(f"An unexpected error occurred for {url}: {e}")
+        error_message = f"An unexpected error occurred for {url}: {e}"
         error_info = info if info else {
             'title': 'An Error Occurred', 
             'webpage_url': url, 
@@ -103,27 +373,112 @@ def get_content_info(url):
         }
         if 'playlist' in url.lower() and not error_info.get('_type') == 'video':
              error_info['_type'] = 'playlist'
-        return error_info, error_info.get('_type') == 'playlist', []
+        return error_info, error_info.get('_type') == 'playlist', [], error_message
+
+# Full info (with formats) for a single playlist video. Playlists are listed flat, so this is only
+# fetched for the video the download options are built from, once the user gets to choosing them.
+# Returns (info, None), or (None, error message) if the video can't be extracted; like
+# get_content_info, it makes no UI calls and its errors are cached with the result.
+@st.cache_data(ttl=3600, max_entries=128, show_spinner="Fetching available formats...")
+def get_video_formats(url):
+    try:
+        with pooled_info_ydl() as ydl:
+            info = ydl.extract_info(url, download=False)
+    except yt_dlp.utils.DownloadError as e:
+        return None, f"Error fetching formats for {url}: {e}"
+    except Exception as e:
+        return None, f"An unexpected error occurred while fetching formats for {url}: {e}"
+    if not info:
+        return None, f"No information was returned for {url}."
+    annotate_formats(info)
+    return info, None
+
+# Formats for a playlist download: from the first selected video that can be extracted, so one
+# age-restricted or blocked video doesn't hide the options for the rest. At most
+# FORMAT_PROBE_ATTEMPTS videos are tried. Returns (info or None, error messages of the videos that failed).
+def get_playlist_formats(entries):
+    errors = []
+    candidates = [entry for entry in entries if entry and entry.get('webpage_url')]
+    for entry in candidates[:FORMAT_PROBE_ATTEMPTS]:
+        info, error_message = get_video_formats(entry['webpage_url'])
+        if info:
+            return info, errors
+        errors.append(error_message)
+    return None, errors
+
+
+# Cheap local check that a URL points to a YouTube video or playlist, done before asking yt-dlp
+def is_youtube_url(url):
+    return bool(YOUTUBE_VIDEO_ID_RE.search(url) or YOUTUBE_PLAYLIST_RE.search(url))
+
+# Map the different URL forms of one video (youtu.be/ID, watch?v=ID&t=30, shorts/ID, ...) to a single
+# canonical URL, so they share one get_content_info cache entry. Playlist and non-YouTube URLs are kept as-is.
+def canonical_content_url(url):
+    video_id_match = YOUTUBE_VIDEO_ID_RE.search(url)
+    if not video_id_match or 'list=' in url:
+        return url
+    return YOUTUBE_WATCH_URL_TEMPLATE.format(video_id=video_id_match.group(1))
+
+# Thumbnail bytes for a URL, kept for a day and shared across sessions so the same thumbnail is only
+# downloaded once. Failures raise instead of returning, so they are not cached.
+@st.cache_data(ttl=86400, max_entries=256, show_spinner=False)
+def cached_thumbnail_bytes(thumbnail_url):
+    response = requests.get(thumbnail_url, timeout=THUMBNAIL_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    # st.image can't render anything that isn't an image (e.g. an HTML error page)
+    if not response.headers.get('Content-Type', '').startswith('image/'):
+        raise ValueError(f"Not an image: {thumbnail_url}")
+    return response.content
+
+# Fetch thumbnail bytes so st.image doesn't have to fetch the URL itself; returns None on failure
+def fetch_thumbnail(thumbnail_url):
+    try:
+        return cached_thumbnail_bytes(thumbnail_url)
+    except (requests.RequestException, ValueError):
+        return None
 
+# Prefer prefetched thumbnail bytes, fall back to letting Streamlit load the URL
+def thumbnail_source(info):
+    return st.session_state.thumbnail_bytes or info.get('thumbnail')
 
-# Function to dynamically generate download options based on desired output type
-def generate_download_options(info, output_type):
+
+# (mtime, size) of a downloaded file, recorded once so the Downloaded Files list doesn't stat it on every rerun
+def downloaded_file_entry(file_path):
+    file_stat = os.stat(file_path)
+    return (file_stat.st_mtime, file_stat.st_size)
+
+# Read a downloaded file only when its download button is actually clicked
+def read_file_bytes(file_path):
+    with open(file_path, "rb") as file:
+        return file.read()
+
+
+# Function to dynamically generate download options based on desired output type. With fast_audio,
+# the MP3 options keep the source audio stream instead of converting it
+def generate_download_options(info, output_type, fast_audio=False):
     options = []
     
     # Check if 'formats' key exists and is not None
     if not info or 'formats' not in info or not info['formats']:
         return [] # No formats available
 
-    # Sort formats by quality (higher resolution first, then higher fps)
-    formats = sorted(info['formats'], key=lambda f: (
+    # Only the formats an output type can offer are sorted by quality (higher resolution first, then
+    # higher fps); the sort is stable, so filtering first gives the same order as filtering afterwards
+    if output_type == 'mp4':
+        # Video-only MP4 and WebM streams
+        candidates = [f for f in info['formats'] if f['has_video'] and not f['has_audio'] and f.get('ext') in ('mp4', 'webm')]
+    else:
+        # Truly audio-only streams
+        candidates = [f for f in info['formats'] if f['has_audio'] and not f['has_video']]
+    formats = sorted(candidates, key=lambda f: (
         f.get('height') or 0, 
         f.get('fps') or 0, 
         f.get('tbr') or 0 # Total bitrate
     ), reverse=True)
 
     if output_type == 'mp4':
-        # Add "Best Video + Best Audio (Merged MP4 - Recommended)" option at the top
-        options.append({
+        # "Best Video + Best Audio (Merged MP4 - Recommended)" option goes at the top
+        best_option = {
             'label': 'Best Video + Best Audio (Merged MP4 - Recommended)',
             'format_id': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio', # Prioritize mp4+m4a, fallback to any best
             'is_merged': True,
@@ -131,285 +486,547 @@ def generate_download_options(info, output_type):
             'vcodec': 'best',
             'acodec': 'aac (re-encoded)',
             'resolution': 'best'
-        })
+        }
 
-        # Add "Video + Audio (Merged)" options for specific MP4 qualities
+        # Build the "Video + Audio (Merged)" options for specific MP4 qualities and the
+        # "Video Only" options (MP4 and WebM) in a single pass over the sorted formats,
+        # reading each field of a format only once
+        merged_options = []
+        video_only_options = []
         merged_video_qualities = set()
         for f in formats:
-            # Filter for video-only MP4 formats that have a height, and haven't been added yet
-            if (f.get('vcodec') != 'none' and f.get('acodec') == 'none' and 
-                f.get('ext') == 'mp4' and f.get('height') and f.get('height') not in merged_video_qualities):
-                options.append({
-                    'label': f"Video {f['height']}p ({f['ext']}) + Best Audio (Merged MP4)",
-                    'format_id': f"{f['format_id']}+bestaudio",
+            ext = f.get('ext')
+            format_id = f['format_id']
+            vcodec = f.get('vcodec')
+            resolution = f.get('resolution')
+            height = f.get('height')
+            # Video-only MP4 formats that have a height, and haven't been added yet, get a merged option
+            if ext == 'mp4' and height and height not in merged_video_qualities:
+                merged_options.append({
+                    'label': f"Video {height}p ({ext}) + Best Audio (Merged MP4)",
+                    'format_id': f"{format_id}+bestaudio",
                     'is_merged': True,
                     'ext': 'mp4', # Explicitly set expected output extension
-                    'vcodec': f.get('vcodec'),
+                    'vcodec': vcodec,
                     'acodec': 'aac (re-encoded)', # Indicate it will be re-encoded
-                    'resolution': f.get('resolution')
-                })
-                merged_video_qualities.add(f['height'])
-        
-        # Add "Video Only" options (MP4 and WebM)
-        video_only_options = []
-        for f in formats:
-            if f.get('vcodec') != 'none' and f.get('acodec') == 'none' and f.get('ext') in ['mp4', 'webm']:
-                label = f"Video Only {f.get('resolution', '')} ({f.get('ext')}, {f.get('vcodec')})"
-                video_only_options.append({
-                    'label': label,
-                    'format_id': f['format_id'],
-                    'is_merged': False,
-                    'ext': f['ext'], # Explicitly set expected output extension
-                    'vcodec': f.get('vcodec'),
-                    'acodec': f.get('acodec'),
-                    'resolution': f.get('resolution')
+                    'resolution': resolution
                 })
-        options.extend(video_only_options)
+                merged_video_qualities.add(height)
+            video_only_options.append({
+                'label': f"Video Only {f.get('resolution', '')} ({ext}, {vcodec})",
+                'format_id': format_id,
+                'is_merged': False,
+                'ext': ext, # Explicitly set expected output extension
+                'vcodec': vcodec,
+                'acodec': f.get('acodec'),
+                'resolution': resolution
+            })
+        options = [best_option] + merged_options + video_only_options
 
     elif output_type == 'mp3':
-        # Add a general "Best Audio (Converted to MP3 - Recommended)" option
+        # Add a general "Best Audio" option: converted to MP3 (recommended), or the original stream in fast mode
         options.append({
-            'label': 'Best Audio (Converted to MP3 - Recommended)',
+            'label': 'Best Audio (Original Stream, No Re-encode - Fastest)' if fast_audio else 'Best Audio (Converted to MP3 - Recommended)',
             'format_id': 'bestaudio',
             'is_merged': False,
             'ext': 'mp3',
+            'keep_audio_stream': fast_audio, # Read by audio_postprocessor
             'vcodec': 'none',
-            'acodec': 'mp3 (re-encoded)',
+            'acodec': 'original (stream copy)' if fast_audio else 'mp3 (re-encoded)',
             'resolution': 'N/A'
         })
         # Add "Audio Only" options for MP3 output
         audio_only_options = []
         for f in formats:
-            if f.get('acodec') != 'none' and f.get('vcodec') == 'none': # Ensure it's truly audio-only
-                label = f"Audio Only ({f.get('acodec', '')}, {f.get('abr', 0)}kbps)"
-                audio_only_options.append({
-                    'label': label,
-                    'format_id': f['format_id'],
-                    'is_merged': False, # Even if it's bestaudio, it's not merged video+audio
-                    'ext': 'mp3', # Explicitly set expected output extension (due to postprocessor)
-                    'vcodec': f.get('vcodec'),
-                    'acodec': f.get('acodec'),
-                    'resolution': f.get('resolution')
-                })
+            label = f"Audio Only ({f.get('acodec', '')}, {f.get('abr', 0)}kbps)"
+            audio_only_options.append({
+                'label': f"{label} - No Re-encode" if fast_audio else label,
+                'format_id': f['format_id'],
+                'is_merged': False, # Even if it's bestaudio, it's not merged video+audio
+                'ext': 'mp3', # Explicitly set expected output extension (due to postprocessor)
+                'keep_audio_stream': fast_audio,
+                'vcodec': f.get('vcodec'),
+                'acodec': f.get('acodec'),
+                'resolution': f.get('resolution')
+            })
         options.extend(audio_only_options)
     
     return options
 
-# Global variable for debug logging of filepath from hook
-download_complete_filepath_from_hook = None 
-
-# Callback for download progress - now primarily for UI updates and debug logging
-def update_progress(d, status_placeholder, progress_bar):
-    global download_complete_filepath_from_hook 
+# Option labels (in dropdown order) and a label -> option lookup for a given video ID, output type and
+# set of formats, shared across sessions. The lookup keeps the first option for a repeated label.
+# The info dict itself is not hashed (leading underscore); formats_key identifies its formats instead.
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_download_options(content_key, output_type, fast_audio, formats_key, _info):
+    options_by_label = {}
+    for opt in generate_download_options(_info, output_type, fast_audio):
+        options_by_label.setdefault(opt['label'], opt)
+    return list(options_by_label), options_by_label
+
+# Reuse the option labels shown in the quality dropdown (and their label lookup) built for this
+# content and output type when the script reruns because of an unrelated widget interaction,
+# instead of re-sorting and re-labelling every format. Switching output type or content falls
+# through to cached_download_options, so going back to an earlier choice doesn't rebuild either.
+def get_download_options(info, output_type):
+    # Keyed on the video ID, so every URL form of a video (and a playlist entry) shares one entry;
+    # the MP3 options differ with "Fast (no re-encode)"
+    fast_audio = output_type == 'mp3' and st.session_state.fast_audio
+    cache_key = (info.get('id') or info.get('webpage_url'), output_type, fast_audio)
+    if st.session_state.download_options_key != cache_key:
+        formats_key = tuple(f.get('format_id') for f in info.get('formats') or [])
+        st.session_state.download_option_labels, st.session_state.download_options_by_label = cached_download_options(
+            cache_key[0], output_type, fast_audio, formats_key, info
+        )
+        st.session_state.download_options_key = cache_key
+    return st.session_state.download_option_labels, st.session_state.download_options_by_label
+
+# Fresh per-download state shared by the hooks of one download (which run on the download thread)
+# and the download panel that draws it: the latest progress (as numbers, formatted only when drawn),
+# the path of the final file and every file yt-dlp produced. Kept per call rather than in a module global.
+def new_progress_state():
+    return {
+        'downloading': False, 'fraction': None, 'speed': None, 'eta': None, 'filepath': None, 'produced': [], 'holds_ffmpeg_slot': False,
+        'debug_mode': st.session_state.debug_mode, # Read here on the script thread, the hooks can't read session state
+    }
+
+# Debug output of the hooks, only printed with "Verbose yt-dlp Logging" on
+def debug_log(progress_state, message):
+    if progress_state['debug_mode']:
+        print(f"DEBUG: {message}")
+
+# Callback for download progress. It runs on the download thread, so it only records the
+# progress for the download panel to draw, and where yt-dlp wrote the file. It reads yt-dlp's
+# numeric fields instead of parsing its formatted strings on every call.
+def update_progress(d, progress_state):
     if d['status'] == 'downloading':
-        p = d.get('_percent_str', '0%').replace(' ', '')
-        speed = d.get('_speed_str', 'N/A')
-        eta = d.get('_eta_str', 'N/A')
-        status_placeholder.text(f"Downloading: {p} at {speed} ETA: {eta}")
-        try:
-            progress_bar.progress(float(d.get('_percent_str', '0%').strip('%')) / 100)
-        except ValueError:
-            pass # Ignore if percentage string is not yet a valid float
+        progress_state['downloading'] = True
+        total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if total_bytes and d.get('downloaded_bytes') is not None:
+            progress_state['fraction'] = min(d['downloaded_bytes'] / total_bytes, 1.0)
+        elif d.get('fragment_count'):
+            # Fragmented downloads without a size estimate still report how many fragments are done
+            progress_state['fraction'] = (d.get('fragment_index') or 0) / d['fragment_count']
+        progress_state['speed'] = d.get('speed')
+        progress_state['eta'] = d.get('eta')
     elif d['status'] == 'finished':
-        progress_bar.progress(1.0) # Ensure it reaches 100%
-        # Capture the actual final filepath for debug logging
-        if 'filepath' in d:
-            download_complete_filepath_from_hook = d['filepath']
-            print(f"DEBUG: Filepath captured from finished hook: {download_complete_filepath_from_hook}")
-        else:
-            print("DEBUG: 'filepath' not found in finished hook data.")
-
-
-# Function to download a single content (video)
-def download_content(url, selected_option, info, status_placeholder, progress_bar):
-    global download_complete_filepath_from_hook
-    download_complete_filepath_from_hook = None # Reset at the start of each download
-
+        progress_state['fraction'] = 1.0 # Ensure it reaches 100%
+        # Path of the downloaded stream; record_final_filepath replaces it once merging/conversion is done
+        progress_state['filepath'] = d.get('info_dict', {}).get('filepath') or d.get('filename')
+        progress_state['produced'].append(progress_state['filepath'])
+        debug_log(progress_state, f"Filepath captured from finished hook: {progress_state['filepath']}")
+
+# Status line for a download's recorded progress, formatted when the download panel draws it
+def progress_status_text(progress_state):
+    if not progress_state['downloading']:
+        return None
+    percent = f"{progress_state['fraction'] * 100:.1f}%" if progress_state['fraction'] is not None else 'N/A'
+    speed = f"{yt_dlp.utils.format_bytes(progress_state['speed'])}/s" if progress_state['speed'] else 'N/A'
+    eta = yt_dlp.utils.formatSeconds(progress_state['eta']) if progress_state['eta'] is not None else 'N/A'
+    return f"Downloading: {percent} at {speed} ETA: {eta}"
+
+# yt-dlp post hook: called with the path of the final file after all postprocessors have run
+def record_final_filepath(filepath, progress_state):
+    progress_state['filepath'] = filepath
+    progress_state['produced'].append(filepath)
+    debug_log(progress_state, f"Final filepath captured from post hook: {filepath}")
+
+# yt-dlp postprocessor hook: when a postprocessor (merger, audio extraction) finishes, its info_dict
+# points at the file it wrote, which becomes the download's current final file
+def record_postprocessor_filepath(d, progress_state):
+    if d['status'] == 'finished':
+        filepath = d.get('info_dict', {}).get('filepath')
+        if filepath:
+            progress_state['filepath'] = filepath
+            progress_state['produced'].append(filepath)
+            debug_log(progress_state, f"Filepath captured from postprocessor hook ({d.get('postprocessor')}): {filepath}")
+
+# yt-dlp postprocessor hook: take one of FFMPEG_SLOTS while a postprocessor runs. If a postprocessor
+# fails, no 'finished' call comes, so the download function releases the slot in its finally block.
+def hold_ffmpeg_slot(d, progress_state):
+    if d['status'] == 'started' and not progress_state['holds_ffmpeg_slot']:
+        FFMPEG_SLOTS.acquire()
+        progress_state['holds_ffmpeg_slot'] = True
+    elif d['status'] == 'finished':
+        release_ffmpeg_slot(progress_state)
+
+def release_ffmpeg_slot(progress_state):
+    if progress_state['holds_ffmpeg_slot']:
+        progress_state['holds_ffmpeg_slot'] = False
+        FFMPEG_SLOTS.release()
+
+# The final file reported by the hooks, if it exists. The hooks see exactly the files this download
+# wrote, so there is no filesystem search that could pick up another download's file.
+def resolve_downloaded_file(progress_state):
+    if progress_state['filepath'] and os.path.exists(progress_state['filepath']):
+        return progress_state['filepath']
+    return None
+
+# Output template for a download: merged downloads are named after the title alone, others also
+# get the format ID. The title is sanitized once per download by the caller.
+def output_template_for(sanitized_title, selected_option):
+    if selected_option['is_merged']:
+        return os.path.join(TEMP_DIR, f"{sanitized_title}.%(ext)s")
+    return os.path.join(TEMP_DIR, f"{sanitized_title}_%(format_id)s.%(ext)s")
+
+
+# Download from the info dict fetched by get_content_info instead of asking YouTube for the metadata again.
+# yt-dlp mutates the dict it processes, so it gets a sanitized copy (as in YoutubeDL.download_with_info_file).
+# If the stored info can't be used any more (e.g. its stream URLs expired), fall back to downloading by URL.
+def download_from_info(ydl, info, url):
+    try:
+        ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=True)
+    except (yt_dlp.utils.DownloadError, yt_dlp.utils.ReExtractInfo) as e:
+        # Only shown with "Verbose yt-dlp Logging", like the rest of yt-dlp's debug output
+        ydl.write_debug(f"Download from cached info failed ({e}), retrying with URL {url}")
+        ydl.download([url])
+
+
+# Postprocessor for the MP3 output type: converts to MP3, or for the "Fast (no re-encode)" options keeps
+# the source audio stream as it is
+def audio_postprocessor(selected_option):
+    if selected_option.get('keep_audio_stream'):
+        # 'best' makes yt-dlp copy the audio stream into a matching container (e.g. .m4a, .opus) instead of encoding it
+        return {'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}
+    return {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}
+
+# Background download jobs of all sessions run on this pool, outside any script run, so a session's
+# page keeps responding to its widgets while its download runs.
+@st.cache_resource(show_spinner=False)
+def get_download_job_executor():
+    return ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOAD_JOBS, thread_name_prefix='download-job')
+
+# Job run for a single video: download it and return the final file path (or None). Runs on a
+# download job thread and makes no Streamlit calls; errors are re-raised by the job's future.
+def run_single_download(ydl_opts, info, url, progress_state):
     try:
-        sanitized_title = sanitize_filename(info.get('title', 'video'))
-        
-        if selected_option['is_merged']:
-            output_filename_template = os.path.join(TEMP_DIR, f"{sanitized_title}.%(ext)s")
-        else:
-            output_filename_template = os.path.join(TEMP_DIR, f"{sanitized_title}_%(format_id)s.%(ext)s")
-
-        ydl_opts = {
-            'outtmpl': output_filename_template,
-            'progress_hooks': [lambda d: update_progress(d, status_placeholder, progress_bar)],
-            'ffmpeg_location': FFMPEG_LOCATION,
-            'retries': 3,
-            'verbose': True,
-            'compat_opts': set(),
-            'noplaylist': True, # Ensure only single video is downloaded from this instance
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/95.0.4638.74 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'en-us,en;q=0.5',
-                'Sec-Fetch-Mode': 'navigate'
-            }
-        }
-
-        if selected_option['is_merged']:
-            ydl_opts['format'] = selected_option['format_id']
-            ydl_opts['merge_output_format'] = 'mp4'
-            ydl_opts['postprocessors'] = [
-                {'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'},
-            ]
-        elif selected_option['ext'] == 'mp3':
-            ydl_opts['format'] = selected_option['format_id']
-            ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }]
-        else:
-            ydl_opts['format'] = selected_option['format_id']
-
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url]) # Execute the download. Hooks will run.
-            
-            # --- Robust File Path Discovery ---
-            final_downloaded_path_to_check = None
-            sanitized_title_for_glob = sanitize_filename(info.get('title', 'video'))
-
-            if selected_option['is_merged']:
-                expected_ext = 'mp4'
-                matching_files = glob.glob(os.path.join(TEMP_DIR, f"{sanitized_title_for_glob}*.{expected_ext}"))
-                exact_match = os.path.join(TEMP_DIR, f"{sanitized_title_for_glob}.{expected_ext}")
-                if exact_match in matching_files:
-                    final_downloaded_path_to_check = exact_match
-                elif matching_files:
-                    final_downloaded_path_to_check = matching_files[0]
-            else:
-                expected_ext = selected_option['ext']
-                matching_files = glob.glob(os.path.join(TEMP_DIR, f"{sanitized_title_for_glob}_*.{expected_ext}"))
-                if matching_files:
-                    final_downloaded_path_to_check = max(matching_files, key=os.path.getmtime) # Get most recent
-                else:
-                    simple_name_path = os.path.join(TEMP_DIR, f"{sanitized_title_for_glob}.{expected_ext}")
-                    if os.path.exists(simple_name_path):
-                        final_downloaded_path_to_check = simple_name_path
-
-            print(f"DEBUG: Final path determined by glob search: {final_downloaded_path_to_check}")
-
-            if final_downloaded_path_to_check and os.path.exists(final_downloaded_path_to_check):
-                st.session_state.downloaded_files.append(final_downloaded_path_to_check) # Append to list
-                status_placeholder.success(f"Download complete: {os.path.basename(final_downloaded_path_to_check)}")
-            else:
-                status_placeholder.error(f"Download completed, but file not found at: {final_downloaded_path_to_check}. This may indicate an unexpected filename or an issue with file creation/deletion by yt-dlp/ffmpeg. Please check console for more errors.")
-
-    except yt_dlp.utils.DownloadError as e:
-        status_placeholder.error(f"Download Error: {e}")
-        st.error("Failed to download. Check the console/logs for details.")
-    except Exception as e:
-        status_placeholder.error(f"An unexpected error occurred: {e}")
-        st.error("Failed to download. Check the console/logs for details.")
-
-
-# Function to download multiple contents (for playlists)
-def download_content_for_playlist(selected_entries, selected_option, status_placeholder, progress_bar):
+            download_from_info(ydl, info, url) # Execute the download. Hooks will run.
+    finally:
+        release_ffmpeg_slot(progress_state)
+    # The hooks report the final path
+    return resolve_downloaded_file(progress_state)
+
+
+# Options for downloading the selected format: the shared base plus this session's sidebar settings.
+# Called on the script thread, since the download threads can't read session state
+def download_ydl_opts(selected_option):
+    ydl_opts = {
+        **BASE_DOWNLOAD_YDL_OPTS,
+        'format': selected_option['format_id'],
+        'concurrent_fragment_downloads': st.session_state.concurrent_fragments, # Overlap fragment requests
+        'verbose': st.session_state.debug_mode, # Full yt-dlp logging only when asked for in the sidebar
+        'postprocessor_args': {} if st.session_state.debug_mode else QUIET_FFMPEG_ARGS,
+    }
+    if ARIA2C_AVAILABLE and st.session_state.use_aria2c:
+        ydl_opts['external_downloader'] = {'default': 'aria2c'}
+    if selected_option['is_merged']:
+        ydl_opts['merge_output_format'] = 'mp4' # The merge itself writes the mp4, no separate remux pass needed
+    elif selected_option['ext'] == 'mp3':
+        ydl_opts['postprocessors'] = [audio_postprocessor(selected_option)]
+    return ydl_opts
+
+# Function to download a single content (video). It only builds the options and starts the
+# download as a background job; download_job_panel shows its progress and its result.
+def download_content(url, selected_option, info):
+    sanitized_title = sanitize_filename(info.get('title', 'video'))
+    output_filename_template = output_template_for(sanitized_title, selected_option)
+
+    progress_state = new_progress_state() # Reset at the start of each download
+    ydl_opts = {
+        'outtmpl': output_filename_template,
+        'progress_hooks': [lambda d: update_progress(d, progress_state)],
+        'post_hooks': [lambda filepath: record_final_filepath(filepath, progress_state)],
+        'postprocessor_hooks': [
+            lambda d: record_postprocessor_filepath(d, progress_state),
+            lambda d: hold_ffmpeg_slot(d, progress_state),
+        ],
+        **download_ydl_opts(selected_option),
+    }
+
+    # Keep the janitor away from this download's files until finish_download_job has listed them
+    held_prefixes = [download_prefix(output_filename_template)]
+    hold_temp_files(HELD_DOWNLOAD_PREFIXES, held_prefixes)
+    st.session_state.download_job = {
+        'kind': 'single',
+        'total': 1,
+        'progress_states': [progress_state],
+        'titles': [info.get('title', 'Untitled')],
+        'results': {}, # Only used by playlist jobs
+        'notices': [],
+        'held_prefixes': held_prefixes,
+        'future': get_download_job_executor().submit(run_single_download, ydl_opts, info, url, progress_state),
+    }
+
+
+# The YoutubeDL of the current playlist worker thread, created on its first video and reused for the
+# rest, so the thread keeps its HTTP connections to YouTube open between videos instead of setting up
+# new ones per video. Its hooks report to whichever video's hook state is in hook_target.
+def playlist_worker_ydl(worker_ydls, ydl_opts, created_ydls):
+    worker = getattr(worker_ydls, 'worker', None)
+    if worker is None:
+        hook_target = {'progress_state': None}
+        worker_opts = dict(
+            ydl_opts,
+            progress_hooks=[lambda d: update_progress(d, hook_target['progress_state'])],
+            post_hooks=[lambda filepath: record_final_filepath(filepath, hook_target['progress_state'])],
+            postprocessor_hooks=[
+                lambda d: record_postprocessor_filepath(d, hook_target['progress_state']),
+                lambda d: hold_ffmpeg_slot(d, hook_target['progress_state']),
+            ],
+        )
+        worker = worker_ydls.worker = (yt_dlp.YoutubeDL(worker_opts), hook_target)
+        created_ydls.append(worker[0]) # Closed by run_playlist_download once the run is over
+    return worker
+
+# Download one playlist video, on a playlist worker thread. It makes no Streamlit calls; the download
+# panel reads its progress from progress_state. Returns the final file path (or None).
+def download_playlist_entry(worker_ydls, ydl_opts, created_ydls, sanitized_title, entry_info, video_url, progress_state, selected_option):
+    ydl, hook_target = playlist_worker_ydl(worker_ydls, ydl_opts, created_ydls)
+    ydl.params['outtmpl']['default'] = output_template_for(sanitized_title, selected_option)
+    hook_target['progress_state'] = progress_state
+    try:
+        download_from_info(ydl, entry_info, video_url) # Download the current video
+    finally:
+        release_ffmpeg_slot(progress_state)
+    # The hooks report the final path
+    return resolve_downloaded_file(progress_state)
+
+# Job run for a playlist: download its videos, up to `workers` at once on a thread pool, which also
+# bounds the number of simultaneous requests to YouTube. Each video's outcome is stored in results
+# (job position -> ('file', path) or ('error', message)) as soon as it is known.
+def run_playlist_download(ydl_opts, videos, selected_option, workers, results):
+    worker_ydls = threading.local() # Each worker thread's (YoutubeDL, hook target)
+    created_ydls = [] # Every worker YoutubeDL of this run, to close them at the end
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    download_playlist_entry, worker_ydls, ydl_opts, created_ydls,
+                    sanitized_title, entry_info, video_url, progress_state, selected_option
+                ): (position, entry_info, progress_state)
+                for position, (entry_info, video_url, sanitized_title, progress_state) in enumerate(videos)
+            }
+            for future in as_completed(futures):
+                position, entry_info, progress_state = futures[future]
+                try:
+                    final_downloaded_path_to_check = future.result()
+                    if final_downloaded_path_to_check:
+                        results[position] = ('file', final_downloaded_path_to_check)
+                    else:
+                        results[position] = ('error', f"Failed to find downloaded file for {entry_info.get('title', 'Untitled')} at {progress_state['filepath']}")
+                except yt_dlp.utils.DownloadError as e:
+                    results[position] = ('error', f"Error downloading {entry_info.get('title', 'Untitled')}: {e}")
+                except Exception as e:
+                    results[position] = ('error', f"An unexpected error occurred for {entry_info.get('title', 'Untitled')}: {e}")
+    finally:
+        for ydl in created_ydls:
+            ydl.close()
+
+# Function to download multiple videos (for playlists). Like download_content, it only prepares the
+# videos and starts them as one background job, with st.session_state.playlist_workers at a time.
+def download_content_for_playlist(selected_entries, selected_option):
     total_videos = len(selected_entries)
     if total_videos == 0:
-        status_placeholder.warning("No videos selected for download.")
+        st.session_state.download_messages = [('warning', "No videos selected for download.")]
         return
 
-    st.session_state.downloaded_files = [] # Clear previous downloads for playlist
-    
+    # Options shared by every video of this run; each worker's YoutubeDL adds its own hooks, and
+    # the output template is set per video
+    ydl_opts = {
+        'outtmpl': os.path.join(TEMP_DIR, "%(title)s.%(ext)s"),
+        **download_ydl_opts(selected_option),
+    }
+
+    videos = [] # (entry info, URL, sanitized title, hook state) for each video to download, in playlist order
+    notices = []
+    used_titles = set() # Lowercased file titles already taken by this run (case-insensitive filesystems)
     for i, entry_info in enumerate(selected_entries):
         if not entry_info: # Skip None entries (e.g., private/deleted videos in a playlist)
-            status_placeholder.info(f"Skipping empty entry {i+1} in playlist.")
+            notices.append(('info', f"Skipping empty entry {i+1} in playlist."))
             continue
 
         video_url = entry_info.get('webpage_url')
         # Also check for 'availability' directly from the entry_info
         if not video_url or entry_info.get('availability') in ['private', 'unlisted', 'unavailable', 'removed_by_youtube', 'removed_by_user']:
             title_display = entry_info.get('title', 'Untitled Video')
-            status_placeholder.warning(f"Skipping video {i+1}: '{title_display}' is unavailable or URL not found.")
+            notices.append(('warning', f"Skipping video {i+1}: '{title_display}' is unavailable or URL not found."))
             continue
 
-        status_placeholder.text(f"Downloading video {i+1}/{total_videos}: {entry_info.get('title', '...')}")
-        # Update overall playlist progress by number of videos processed
-        progress_bar.progress((i / total_videos)) 
-
-        # Reset hook global for each video download (mostly for debug logging)
-        global download_complete_filepath_from_hook
-        download_complete_filepath_from_hook = None
+        sanitized_title = sanitize_filename(entry_info.get('title', 'video'))
+        # The videos are downloaded in parallel, so entries with the same title would write the same
+        # stream, .part and output files at the same time; the later ones get the video ID added
+        if sanitized_title.lower() in used_titles:
+            base_title = f"{sanitized_title} [{entry_info.get('id') or i + 1}]"
+            sanitized_title, copy_number = base_title, 2
+            while sanitized_title.lower() in used_titles: # Same video listed more than once
+                sanitized_title = f"{base_title} ({copy_number})"
+                copy_number += 1
+        used_titles.add(sanitized_title.lower())
+        videos.append((entry_info, video_url, sanitized_title, new_progress_state())) # Fresh hook state for each video download
+
+    # Keep the janitor away from every video's files, including the ones that finish early, until
+    # finish_download_job has listed them
+    held_prefixes = [download_prefix(output_template_for(video[2], selected_option)) for video in videos]
+    hold_temp_files(HELD_DOWNLOAD_PREFIXES, held_prefixes)
+    results = {}
+    st.session_state.download_job = {
+        'kind': 'playlist',
+        'total': total_videos,
+        'progress_states': [video[3] for video in videos],
+        'titles': [video[0].get('title', 'Untitled') for video in videos],
+        'results': results,
+        'notices': notices,
+        'held_prefixes': held_prefixes,
+        'future': get_download_job_executor().submit(
+            run_playlist_download, ydl_opts, videos, selected_option, st.session_state.playlist_workers, results
+        ),
+    }
+
+
+# Add a finished download to the Downloaded Files list. It may already be gone (janitor, Clean
+# button) by the time the job is collected, which is reported instead of raised.
+def record_downloaded_file(file_path, messages):
+    try:
+        # ffmpeg's merge gives its output the mtime of the oldest stream, which in a long playlist job
+        # can already be past TEMP_FILE_TTL_SECONDS; the janitor's TTL counts from collection instead
+        os.utime(file_path)
+        file_entry = downloaded_file_entry(file_path)
+    except OSError as e:
+        messages.append(('error', f"Downloaded file {os.path.basename(file_path)} is no longer available: {e}"))
+        return False
+    if file_path not in st.session_state.downloaded_files:
+        hold_temp_files(LISTED_DOWNLOAD_FILES, [file_path])
+    st.session_state.downloaded_files[file_path] = file_entry
+    return True
+
+# Empty this session's Downloaded Files list, which lets the janitor's size pass remove those files again
+def clear_downloaded_files():
+    release_temp_files(LISTED_DOWNLOAD_FILES, list(st.session_state.downloaded_files))
+    st.session_state.downloaded_files = {}
+
+# Collect a finished download job on the script thread: record its files and the messages to show.
+# The job is cleared even if collecting it fails, so the Start buttons never stay disabled.
+def finish_download_job(job):
+    messages = list(job['notices'])
+    try:
+        # Track what this session wrote to TEMP_DIR (even on failure) so cleanup can target exactly those files
+        for progress_state in job['progress_states']:
+            st.session_state.produced_files.extend(progress_state['produced'])
 
         try:
-            sanitized_title = sanitize_filename(entry_info.get('title', 'video'))
-            
-            if selected_option['is_merged']:
-                output_filename_template = os.path.join(TEMP_DIR, f"{sanitized_title}.%(ext)s")
-            else:
-                output_filename_template = os.path.join(TEMP_DIR, f"{sanitized_title}_%(format_id)s.%(ext)s")
-
-            ydl_opts = {
-                'outtmpl': output_filename_template,
-                'progress_hooks': [lambda d: update_progress(d, status_placeholder, progress_bar)],
-                'ffmpeg_location': FFMPEG_LOCATION,
-                'retries': 3,
-                'verbose': True,
-                'compat_opts': set(),
-                'noplaylist': True, # Crucial: ensure only this single video is downloaded by this YDL instance
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/95.0.4638.74 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                    'Sec-Fetch-Mode': 'navigate'
-                }
-            }
-
-            if selected_option['is_merged']:
-                ydl_opts['format'] = selected_option['format_id']
-                ydl_opts['merge_output_format'] = 'mp4'
-                ydl_opts['postprocessors'] = [{'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'}]
-            elif selected_option['ext'] == 'mp3':
-                ydl_opts['format'] = selected_option['format_id']
-                ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}]
-            else:
-                ydl_opts['format'] = selected_option['format_id']
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([video_url]) # Download the current video in the loop
-
-                # --- Robust File Path Discovery for the current video ---
-                final_downloaded_path_to_check = None
-                sanitized_title_for_glob = sanitize_filename(entry_info.get('title', 'video'))
-
-                if selected_option['is_merged']:
-                    expected_ext = 'mp4'
-                    matching_files = glob.glob(os.path.join(TEMP_DIR, f"{sanitized_title_for_glob}*.{expected_ext}"))
-                    exact_match = os.path.join(TEMP_DIR, f"{sanitized_title_for_glob}.{expected_ext}")
-                    if exact_match in matching_files:
-                        final_downloaded_path_to_check = exact_match
-                    elif matching_files:
-                        final_downloaded_path_to_check = matching_files[0] # Take the first match
-                else:
-                    expected_ext = selected_option['ext']
-                    matching_files = glob.glob(os.path.join(TEMP_DIR, f"{sanitized_title_for_glob}_*.{expected_ext}"))
-                    if matching_files:
-                        final_downloaded_path_to_check = max(matching_files, key=os.path.getmtime) # Get most recent
-                    else:
-                        simple_name_path = os.path.join(TEMP_DIR, f"{sanitized_title_for_glob}.{expected_ext}")
-                        if os.path.exists(simple_name_path):
-                            final_downloaded_path_to_check = simple_name_path
-
-                if final_downloaded_path_to_check and os.path.exists(final_downloaded_path_to_check):
-                    st.session_state.downloaded_files.append(final_downloaded_path_to_check)
-                    status_placeholder.text(f"Downloaded: {os.path.basename(final_downloaded_path_to_check)} ({i+1}/{total_videos})")
-                else:
-                    status_placeholder.error(f"Failed to find downloaded file for {entry_info.get('title', 'Untitled')} at {final_downloaded_path_to_check}")
-
+            final_downloaded_path_to_check = job['future'].result()
         except yt_dlp.utils.DownloadError as e:
-            status_placeholder.error(f"Error downloading {entry_info.get('title', 'Untitled')}: {e}")
+            messages += [('error', f"Download Error: {e}"), ('error', "Failed to download. Check the console/logs for details.")]
+            final_downloaded_path_to_check = None
         except Exception as e:
-            status_placeholder.error(f"An unexpected error occurred for {entry_info.get('title', 'Untitled')}: {e}")
-
-    progress_bar.progress(1.0) # Ensure overall progress reaches 100%
-    if st.session_state.downloaded_files:
-        status_placeholder.success(f"Playlist download complete. Downloaded {len(st.session_state.downloaded_files)} out of {total_videos} videos.")
+            messages += [('error', f"An unexpected error occurred: {e}"), ('error', "Failed to download. Check the console/logs for details.")]
+            final_downloaded_path_to_check = None
+        else:
+            if job['kind'] == 'single':
+                if final_downloaded_path_to_check:
+                    if record_downloaded_file(final_downloaded_path_to_check, messages):
+                        messages.append(('success', f"Download complete: {os.path.basename(final_downloaded_path_to_check)}"))
+                else:
+                    messages.append(('error', f"Download completed, but file not found at: {job['progress_states'][0]['filepath']}. This may indicate an unexpected filename or an issue with file creation/deletion by yt-dlp/ffmpeg. Please check console for more errors."))
+
+        if job['kind'] == 'playlist':
+            results = job['results']
+            # Keep the playlist order rather than the order the videos finished in
+            clear_downloaded_files()
+            for i in sorted(results):
+                if results[i][0] == 'file':
+                    record_downloaded_file(results[i][1], messages)
+                else:
+                    messages.append(('error', results[i][1]))
+            if st.session_state.downloaded_files:
+                messages.append(('success', f"Playlist download complete. Downloaded {len(st.session_state.downloaded_files)} out of {job['total']} videos."))
+            else:
+                messages.append(('warning', "No files were successfully downloaded from the playlist."))
+    finally:
+        release_temp_files(HELD_DOWNLOAD_PREFIXES, job['held_prefixes'])
+        st.session_state.download_messages = messages
+        st.session_state.download_job = None
+
+# Progress of the running download job, redrawn every PROGRESS_UPDATE_INTERVAL_SECONDS by rerunning
+# only this fragment; the hooks just record progress, so their call rate never reaches the browser.
+# Once the job is done its results are collected and the whole page reruns to list the new files.
+@st.fragment(run_every=PROGRESS_UPDATE_INTERVAL_SECONDS)
+def download_job_panel():
+    job = st.session_state.download_job
+    if job is None:
+        return
+    if job['future'].done():
+        finish_download_job(job)
+        st.rerun()
+
+    for level, text in job['notices']:
+        getattr(st, level)(text)
+    if job['kind'] == 'single':
+        progress_state = job['progress_states'][0]
+        st.text(progress_status_text(progress_state) or f"Starting download: {job['titles'][0]}")
+        st.progress(progress_state['fraction'] or 0.0)
     else:
-        status_placeholder.warning("No files were successfully downloaded from the playlist.")
+        results = job['results']
+        finished_count = len(results)
+        # Overall playlist progress: finished videos plus the partial progress of the ones still running
+        running_fraction = sum(
+            progress_state['fraction'] or 0
+            for position, progress_state in enumerate(job['progress_states']) if position not in results
+        )
+        st.text(f"Downloading videos: {finished_count}/{len(job['progress_states'])} finished, {len(job['progress_states']) - finished_count} in progress or queued")
+        st.progress(min((finished_count + running_fraction) / job['total'], 1.0))
+        for position in sorted(results):
+            if results[position][0] == 'error':
+                st.error(results[position][1])
+
+
+# Download buttons for the downloaded files. Sizes come from the entries recorded when each download
+# finished; every DOWNLOADED_FILES_REFRESH_SECONDS this fragment reruns on its own and re-checks the
+# files on disk, dropping ones that were removed (e.g. by the temp dir janitor) and updating changed ones
+@st.fragment(run_every=DOWNLOADED_FILES_REFRESH_SECONDS)
+def downloaded_files_panel():
+    downloaded_files = st.session_state.downloaded_files
+    if downloaded_files and time.monotonic() - st.session_state.downloaded_files_checked_at >= DOWNLOADED_FILES_REFRESH_SECONDS:
+        for file_path in list(downloaded_files):
+            try:
+                downloaded_files[file_path] = downloaded_file_entry(file_path)
+            except FileNotFoundError:
+                st.warning(f"File not found on disk: {os.path.basename(file_path)}")
+                del downloaded_files[file_path]
+                release_temp_files(LISTED_DOWNLOAD_FILES, [file_path])
+        st.session_state.downloaded_files_checked_at = time.monotonic()
+    if not downloaded_files:
+        return
+
+    st.subheader("Downloaded Files:")
+    for file_path, (_, file_size) in downloaded_files.items():
+        file_name = os.path.basename(file_path)
+        file_size_mb = file_size / (1024 * 1024)
+        if file_size_mb > MAX_FILE_SIZE_MB:
+            # Serving a file this large through st.download_button would copy all of it through
+            # the Streamlit server's memory, so point to where it is stored instead
+            st.info(f"{file_name} ({file_size_mb:.2f} MB) is larger than {MAX_FILE_SIZE_MB} MB and can't be downloaded through the browser. It is saved at: {file_path}")
+            continue
+        # Pass a callable so Streamlit defers reading the file until the button is clicked,
+        # instead of loading every downloaded file into memory on each rerun
+        st.download_button(
+            label=f"⬇️ {file_name} ({file_size_mb:.2f} MB)",
+            data=functools.partial(read_file_bytes, file_path),
+            file_name=file_name,
+            mime=DOWNLOAD_MIME_TYPES.get(os.path.splitext(file_name)[1].lower(), "application/octet-stream"),
+            key=f'download_button_{file_path}' # Use file_path as key for uniqueness
+        )
+
+
+# "Fast (no re-encode)" checkbox of the MP3 output type. Its value is kept in the fast_audio session key
+# rather than in the widget's own key, whose state Streamlit drops while MP4 is selected and the checkbox isn't shown
+def fast_audio_checkbox():
+    st.session_state.fast_audio = st.checkbox(
+        "Fast (no re-encode)",
+        value=st.session_state.fast_audio,
+        key='fast_audio_checkbox',
+        help="Keep the original audio stream (usually .m4a or .opus) instead of converting it to MP3. Much faster, but the file won't be an MP3."
+    )
 
 
 # --- Streamlit App Layout ---
@@ -417,8 +1034,11 @@ st.set_page_config(page_title="YouTube Downloader", page_icon="⬇️", layout="
 
 st.title("⬇️ YouTube Downloader")
 
-# Input for YouTube URL
-video_url = st.text_input("Enter YouTube Video or Playlist URL:")
+# Input for YouTube URL. Inside a form, the URL is only submitted on Enter or the Fetch button,
+# so half-typed URLs never reach yt-dlp
+with st.form("url_form", border=False):
+    video_url = st.text_input("Enter YouTube Video or Playlist URL:").strip()
+    st.form_submit_button("Fetch")
 
 # Session state to store content info (video or playlist) and downloaded files
 if 'content_info' not in st.session_state:
@@ -427,14 +1047,66 @@ if 'is_playlist' not in st.session_state:
     st.session_state.is_playlist = False
 if 'playlist_entries' not in st.session_state:
     st.session_state.playlist_entries = []
-if 'downloaded_files' not in st.session_state: # This will now be a list of downloaded file paths
-    st.session_state.downloaded_files = []
-
-if video_url:
-    # Fetch content info if not already cached/fetched for this URL
-    # Use content_info.get('webpage_url') as a unique identifier for the cached entry
-    if st.session_state.content_info is None or st.session_state.content_info.get('webpage_url') != video_url:
-        st.session_state.content_info, st.session_state.is_playlist, st.session_state.playlist_entries = get_content_info(video_url)
+if 'downloaded_files' not in st.session_state: # Downloaded file path -> (mtime, size), in download order
+    st.session_state.downloaded_files = {}
+if 'downloaded_files_checked_at' not in st.session_state: # When the downloaded files were last re-checked on disk
+    st.session_state.downloaded_files_checked_at = time.monotonic()
+if 'produced_files' not in st.session_state: # Every file this session's downloads wrote to TEMP_DIR
+    st.session_state.produced_files = []
+if 'content_url' not in st.session_state: # Canonical URL the current content_info was fetched for
+    st.session_state.content_url = None
+if 'content_error' not in st.session_state: # Error message returned by the last info fetch, if any
+    st.session_state.content_error = None
+if 'thumbnail_bytes' not in st.session_state: # Thumbnail prefetched alongside the content info
+    st.session_state.thumbnail_bytes = None
+if 'concurrent_fragments' not in st.session_state: # Backs the "Fragment Parallelism" sidebar slider
+    st.session_state.concurrent_fragments = DEFAULT_CONCURRENT_FRAGMENTS
+if 'playlist_workers' not in st.session_state: # Backs the "Parallel Playlist Downloads" sidebar slider
+    st.session_state.playlist_workers = DEFAULT_PLAYLIST_WORKERS
+if 'fast_audio' not in st.session_state: # "Fast (no re-encode)" choice, kept while the checkbox is hidden (MP4 selected)
+    st.session_state.fast_audio = False
+if 'download_job' not in st.session_state: # The running background download job of this session, if any
+    st.session_state.download_job = None
+if 'download_messages' not in st.session_state: # (level, text) results of the last finished download
+    st.session_state.download_messages = []
+if 'debug_mode' not in st.session_state: # Backs the "Verbose yt-dlp Logging" sidebar checkbox
+    st.session_state.debug_mode = False
+if 'use_aria2c' not in st.session_state: # Backs the "Download with aria2c" sidebar checkbox
+    st.session_state.use_aria2c = False
+if 'download_options_key' not in st.session_state: # (video ID, output type) the cached download options belong to
+    st.session_state.download_options_key = None
+    st.session_state.download_option_labels = []
+    st.session_state.download_options_by_label = {}
+
+if video_url and not is_youtube_url(video_url):
+    # Checked locally with the precompiled patterns, so no network request is made for it
+    st.warning("Please enter a valid YouTube video or playlist URL.")
+elif video_url:
+    content_url = canonical_content_url(video_url)
+    # Fetch content info if not already fetched for this URL. Compare against the canonical URL that was
+    # fetched rather than the webpage_url yt-dlp reports, which can differ (e.g. watch?v=...&list=... URLs)
+    # and would otherwise trigger a refetch on every rerun
+    if st.session_state.content_info is None or st.session_state.content_url != content_url:
+        st.session_state.content_url = content_url
+        video_id_match = YOUTUBE_VIDEO_ID_RE.search(content_url)
+        guessed_video_id = video_id_match.group(1) if video_id_match else None
+        # Fetch the thumbnail in the background while yt-dlp extracts the content info,
+        # so both network round-trips overlap instead of running back to back
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            thumbnail_future = executor.submit(fetch_thumbnail, THUMBNAIL_URL_TEMPLATE.format(video_id=guessed_video_id)) if guessed_video_id else None
+            (st.session_state.content_info, st.session_state.is_playlist,
+             st.session_state.playlist_entries, st.session_state.content_error) = get_content_info(content_url)
+            thumbnail_bytes = thumbnail_future.result() if thumbnail_future else None
+        # Only keep the guessed thumbnail if it belongs to the content yt-dlp actually returned,
+        # otherwise download the real one once now rather than having st.image fetch it on every rerun
+        if st.session_state.content_info.get('id') != guessed_video_id:
+            thumbnail_bytes = None
+        if thumbnail_bytes is None and st.session_state.content_info.get('thumbnail'):
+            thumbnail_bytes = fetch_thumbnail(st.session_state.content_info['thumbnail'])
+        st.session_state.thumbnail_bytes = thumbnail_bytes
+
+    if st.session_state.content_error:
+        st.error(st.session_state.content_error)
 
     if st.session_state.content_info:
         info = st.session_state.content_info
@@ -442,8 +1114,8 @@ if video_url:
         if st.session_state.is_playlist:
             st.subheader(f"Playlist Title: {info.get('title', 'N/A')}")
             st.write(f"Number of videos: {len(st.session_state.playlist_entries)}")
-            if 'thumbnail' in info:
-                st.image(info['thumbnail'], caption="Playlist Thumbnail", width=200) # Smaller thumbnail for playlist
+            if thumbnail_source(info):
+                st.image(thumbnail_source(info), caption="Playlist Thumbnail", width=200) # Smaller thumbnail for playlist
 
             # Option to download entire playlist or select specific videos
             download_scope = st.radio(
@@ -486,33 +1158,40 @@ if video_url:
                     index=0,
                     key='playlist_output_type'
                 )
-                download_options = generate_download_options(first_valid_entry_for_formats, output_type)
+                if output_type == 'mp3':
+                    fast_audio_checkbox()
+                # Playlist entries are flat, so take the formats from the full info of the first selected
+                # video that can be extracted
+                format_info, format_errors = get_playlist_formats(selected_videos_for_download)
+                for error_message in format_errors:
+                    # Only a warning when a later video could be used instead
+                    (st.warning if format_info else st.error)(error_message)
+                download_option_labels, download_options_by_label = get_download_options(format_info, output_type) if format_info else ([], {})
                 
-                if not download_options:
+                if not download_option_labels:
                     st.warning("No suitable download formats found for the selected output type for these videos.")
                     # No st.stop(), allow the app to render. Download button will not appear.
                 else:
                     selected_label = st.selectbox(
                         "Select Quality/Stream:",
-                        options=[opt['label'] for opt in download_options],
+                        options=download_option_labels,
                         index=0,
                         key='playlist_selected_format_label'
                     )
-                    selected_option = next(opt for opt in download_options if opt['label'] == selected_label)
+                    selected_option = download_options_by_label[selected_label]
 
-                    if st.button("🚀 Start Download Selected Videos"):
-                        st.session_state.downloaded_files = [] # Reset list of downloaded files
-                        status_placeholder = st.empty()
-                        progress_bar = st.progress(0)
-                        # Call the new playlist download function
-                        download_content_for_playlist(selected_videos_for_download, selected_option, status_placeholder, progress_bar)
+                    if st.button("🚀 Start Download Selected Videos", disabled=st.session_state.download_job is not None):
+                        clear_downloaded_files() # Reset list of downloaded files
+                        # Start the playlist download job; download_job_panel below shows its progress
+                        download_content_for_playlist(selected_videos_for_download, selected_option)
+                        st.rerun() # Redraw the page with the download buttons disabled while the job runs
 
 
         else: # Single video mode
             st.subheader(f"Video Title: {info.get('title', 'N/A')}")
             # Corrected usage of st.image parameter for width
-            if 'thumbnail' in info:
-                st.image(info['thumbnail'], caption="Video Thumbnail", use_container_width=True)
+            if thumbnail_source(info):
+                st.image(thumbnail_source(info), caption="Video Thumbnail", width="stretch")
 
             output_type = st.radio(
                 "Select Final Output Type:",
@@ -520,52 +1199,76 @@ if video_url:
                 index=0,
                 key='single_video_output_type'
             )
-            download_options = generate_download_options(info, output_type)
+            if output_type == 'mp3':
+                fast_audio_checkbox()
+            download_option_labels, download_options_by_label = get_download_options(info, output_type)
             
-            if not download_options:
+            if not download_option_labels:
                 st.warning("No suitable download formats found for the selected output type for this content. It might be unavailable or private.")
                 # Removed st.stop(), allow app to continue
             else:
                 selected_label = st.selectbox(
                     "Select Quality/Stream:",
-                    options=[opt['label'] for opt in download_options],
+                    options=download_option_labels,
                     index=0,
                     key='single_video_selected_format_label'
                 )
-                selected_option = next(opt for opt in download_options if opt['label'] == selected_label)
+                selected_option = download_options_by_label[selected_label]
 
-                if st.button("🚀 Start Download"):
-                    st.session_state.downloaded_files = [] # Reset list for single video
-                    status_placeholder = st.empty()
-                    progress_bar = st.progress(0)
-                    # Call original download_content for a single video
-                    download_content(video_url, selected_option, info, status_placeholder, progress_bar)
+                if st.button("🚀 Start Download", disabled=st.session_state.download_job is not None):
+                    clear_downloaded_files() # Reset list for single video
+                    # Start the download job; download_job_panel below shows its progress
+                    download_content(content_url, selected_option, info)
+                    st.rerun() # Redraw the page with the download buttons disabled while the job runs
 
     else:
         st.warning("Please enter a valid YouTube video or playlist URL.")
 
+# Progress of a running download, and then the messages of the last finished one (shown once)
+if st.session_state.download_job is not None:
+    download_job_panel()
+for level, text in st.session_state.download_messages:
+    getattr(st, level)(text)
+st.session_state.download_messages = []
+
 # Display download buttons for all downloaded files in session state
-if st.session_state.downloaded_files:
-    st.subheader("Downloaded Files:")
-    for file_path in st.session_state.downloaded_files:
-        if os.path.exists(file_path):
-            file_name = os.path.basename(file_path)
-            with open(file_path, "rb") as file:
-                st.download_button(
-                    label=f"⬇️ {file_name}",
-                    data=file,
-                    file_name=file_name,
-                    mime=f"application/octet-stream",
-                    key=f'download_button_{file_path}' # Use file_path as key for uniqueness
-                )
-        else:
-            st.warning(f"File not found on disk: {os.path.basename(file_path)}")
+downloaded_files_panel()
 
 # Sidebar for utility actions and info
 st.sidebar.title("Maintenance")
 if st.sidebar.button("Clean Temporary Downloads"):
-    clean_temp_dir()
-    st.session_state.downloaded_files = [] # Clear download state if temp files are cleaned
+    clean_temp_dir(st.session_state.produced_files)
+    clear_downloaded_files() # Clear download state if temp files are cleaned
+
+st.sidebar.slider(
+    "Fragment Parallelism",
+    min_value=1,
+    max_value=MAX_CONCURRENT_FRAGMENTS,
+    key='concurrent_fragments',
+    help="How many fragments of a video yt-dlp downloads at the same time."
+)
+
+st.sidebar.slider(
+    "Parallel Playlist Downloads",
+    min_value=1,
+    max_value=MAX_PLAYLIST_WORKERS,
+    key='playlist_workers',
+    help="How many videos of a playlist are downloaded at the same time."
+)
+
+st.sidebar.checkbox(
+    "Download with aria2c",
+    key='use_aria2c',
+    disabled=not ARIA2C_AVAILABLE,
+    help="Fetch each file over several parallel connections with aria2c. Can be faster, but no live progress is shown: a download stays at 0% until each of its streams is complete."
+    + ("" if ARIA2C_AVAILABLE else " aria2c is not installed on this server.")
+)
+
+st.sidebar.checkbox(
+    "Verbose yt-dlp Logging",
+    key='debug_mode',
+    help="Log every yt-dlp step to the console. Useful for debugging, but slows down downloads with many fragments."
+)
 
 st.sidebar.markdown("""
 ---